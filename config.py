@@ -28,9 +28,31 @@ LOCAL_LLM_BASE_URL = "http://localhost:1234/v1"
 USE_LOCAL_LLM = os.getenv('USE_LOCAL_LLM', 'false').lower()
 LOCAL_LLM_MAX_TOKENS = int(os.getenv('LOCAL_LLM_MAX_TOKENS', '500'))
 
+# Processing pipeline mode: 'full' runs every agent, 'fast' uses a single generation call
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'full').lower()
+FAST_PATH_KB_CHAR_BUDGET = int(os.getenv('FAST_PATH_KB_CHAR_BUDGET', '4000'))
+FAST_PATH_HISTORY_CHAR_BUDGET = int(os.getenv('FAST_PATH_HISTORY_CHAR_BUDGET', '2000'))
+FAST_PATH_QUERY_KEYWORDS = int(os.getenv('FAST_PATH_QUERY_KEYWORDS', '12'))
+
+# Runtime diagnostics (see src/diagnostics.py); a port of 0 disables the control endpoint
+DIAGNOSTICS_DIR = os.getenv('DIAGNOSTICS_DIR', os.path.join(BASE_DIR, "diagnostics"))
+DIAGNOSTICS_PORT = int(os.getenv('DIAGNOSTICS_PORT', '0'))
+DIAGNOSTICS_PROFILE_SECONDS = float(os.getenv('DIAGNOSTICS_PROFILE_SECONDS', '30'))
+DIAGNOSTICS_SAMPLE_INTERVAL = float(os.getenv('DIAGNOSTICS_SAMPLE_INTERVAL', '0.01'))
+DIAGNOSTICS_TRACEMALLOC_FRAMES = int(os.getenv('DIAGNOSTICS_TRACEMALLOC_FRAMES', '0'))
+# How long tracemalloc runs when started by SIGUSR2 before a final report is written and it stops
+DIAGNOSTICS_TRACEMALLOC_SECONDS = float(os.getenv('DIAGNOSTICS_TRACEMALLOC_SECONDS', '600'))
+DIAGNOSTICS_MAX_PROFILE_SECONDS = 600
+DIAGNOSTICS_MIN_SAMPLE_INTERVAL = 0.001
+DIAGNOSTICS_MAX_SAMPLE_INTERVAL = 1.0
+
+# Responses with this many words or fewer are not turned into drafts
+MIN_RESPONSE_WORDS = 50
+
 print(f"OPENAI_API_KEY: {OPENAI_API_KEY}")  # This will print the actual key, be careful!
 print(f"DOCUMENTS_DIR: {DOCUMENTS_DIR}")
 print(f"USE_LOCAL_LLM: {USE_LOCAL_LLM}")
+print(f"PIPELINE_MODE: {PIPELINE_MODE}")
 
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY is not set in the .env file")
@@ -38,6 +60,21 @@ if not OPENAI_API_KEY:
 if not DOCUMENTS_DIR:
     raise ValueError("DOCUMENTS_DIR is not set in the .env file")
 
+if PIPELINE_MODE not in ('full', 'fast'):
+    raise ValueError(f"PIPELINE_MODE must be 'full' or 'fast', got '{PIPELINE_MODE}'")
+
+# Comparisons are written so that nan fails them too
+if not 0 < DIAGNOSTICS_PROFILE_SECONDS <= DIAGNOSTICS_MAX_PROFILE_SECONDS:
+    raise ValueError(f"DIAGNOSTICS_PROFILE_SECONDS must be in (0, {DIAGNOSTICS_MAX_PROFILE_SECONDS}], "
+                     f"got {DIAGNOSTICS_PROFILE_SECONDS}")
+
+if not DIAGNOSTICS_MIN_SAMPLE_INTERVAL <= DIAGNOSTICS_SAMPLE_INTERVAL <= DIAGNOSTICS_MAX_SAMPLE_INTERVAL:
+    raise ValueError(f"DIAGNOSTICS_SAMPLE_INTERVAL must be in [{DIAGNOSTICS_MIN_SAMPLE_INTERVAL}, "
+                     f"{DIAGNOSTICS_MAX_SAMPLE_INTERVAL}], got {DIAGNOSTICS_SAMPLE_INTERVAL}")
+
+if not 0 < DIAGNOSTICS_TRACEMALLOC_SECONDS < float('inf'):
+    raise ValueError(f"DIAGNOSTICS_TRACEMALLOC_SECONDS must be a positive number, got {DIAGNOSTICS_TRACEMALLOC_SECONDS}")
+
 # Add this line for Gmail API scopes
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 
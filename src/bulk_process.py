@@ -0,0 +1,276 @@
+"""Offline bulk processing of a mail archive.
+
+Streams messages from an mbox file or a directory of .eml files, bulk-loads them into the
+email history, then runs the processing pipeline over a selected subset with parallel workers
+and writes the drafts to local .eml files instead of calling the Gmail API.
+
+    python -m src.bulk_process archive.mbox --since 2024-09-01 --workers 8 --output-dir drafts
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import argparse
+import mailbox
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from email import policy
+from email.parser import BytesParser
+from email.mime.text import MIMEText
+from email.utils import parseaddr, parsedate_to_datetime
+from config import PIPELINE_MODE, MIN_RESPONSE_WORDS, EMAIL_ADDRESS
+from src.email_history import EmailHistory
+from src.email_processing import ProcessedEmails
+from src.knowledge_base import KnowledgeBase
+from src.email_processing_pipeline import ProcessingPipeline
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def iter_messages(source):
+    """Yield parsed email.message.EmailMessage objects one at a time from an mbox file or .eml directory."""
+    parser = BytesParser(policy=policy.default)
+    if os.path.isdir(source):
+        for root, _, files in sorted(os.walk(source)):
+            for name in sorted(files):
+                if name.lower().endswith('.eml'):
+                    with open(os.path.join(root, name), 'rb') as f:
+                        yield parser.parse(f)
+    else:
+        mbox = mailbox.mbox(source, factory=parser.parse, create=False)
+        try:
+            for message in mbox:
+                yield message
+        finally:
+            mbox.close()
+
+def get_body(message):
+    part = message.get_body(preferencelist=('plain',))
+    if part is None:
+        return "No readable content"
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeDecodeError):
+        # Unknown or wrong charset declared, fall back to a lossy decode
+        return part.get_payload(decode=True).decode('utf-8', errors='replace')
+
+def get_date(message):
+    try:
+        date = parsedate_to_datetime(message['date'])
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is not None:
+        # Stored as naive local time, matching what GmailMonitor writes
+        date = date.astimezone().replace(tzinfo=None)
+    return date
+
+def parse_message(message):
+    subject = str(message['subject'] or 'No Subject')
+    sender = parseaddr(str(message['from'] or ''))[1]
+    date = get_date(message)
+    body = get_body(message)
+    message_id = str(message['message-id'] or '').strip()
+    if not message_id:
+        # Hash the raw Date header rather than the parsed date, which is converted to the local
+        # timezone, and include the body so different messages with the same subject don't collide
+        key = f"{message['from']}|{message['date']}|{subject}|{body}".encode('utf-8', errors='replace')
+        message_id = f"<{hashlib.sha1(key).hexdigest()}@bulk-process>"
+    # The first References entry is the thread root; fall back to the parent, then the message itself
+    references = str(message['references'] or '').split()
+    thread_id = references[0] if references else (str(message['in-reply-to'] or '').strip() or message_id)
+    return {
+        'id': message_id,
+        'sender': sender,
+        'recipient': parseaddr(str(message['to'] or ''))[1] or 'me',
+        'subject': subject,
+        'body': body,
+        'date': date,
+        'thread_id': thread_id,
+    }
+
+def iter_emails(source):
+    for message in iter_messages(source):
+        try:
+            yield parse_message(message)
+        except Exception as e:
+            logging.error(f"Skipping unparseable message {message.get('message-id')}: {e}")
+
+def select_emails(emails, since=None, sender=None, subject=None, limit=None, exclude_sender=None):
+    subject_pattern = re.compile(subject, re.IGNORECASE) if subject else None
+    selected = 0
+    for email in emails:
+        if limit is not None and selected >= limit:
+            return
+        if exclude_sender and email['sender'].lower() == exclude_sender.lower():
+            continue
+        if since and (email['date'] is None or email['date'] < since):
+            continue
+        if sender and sender.lower() not in email['sender'].lower():
+            continue
+        if subject_pattern and not subject_pattern.search(email['subject']):
+            continue
+        selected += 1
+        yield email
+
+def draft_path(output_dir, email_id):
+    # Sanitizing and truncating can map different IDs to the same name, the hash keeps them apart
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', email_id.strip('<>'))[:120]
+    digest = hashlib.sha1(email_id.encode('utf-8')).hexdigest()[:10]
+    return os.path.join(output_dir, f"{name}-{digest}.eml")
+
+def write_draft(output_dir, email, response):
+    mime_message = MIMEText(response)
+    mime_message['to'] = email['sender']
+    mime_message['subject'] = f"Re: {email['subject']}"
+    mime_message['In-Reply-To'] = email['id']
+    mime_message['References'] = email['id']
+    path = draft_path(output_dir, email['id'])
+    with open(path, 'wb') as f:
+        f.write(mime_message.as_bytes())
+    return path
+
+def load_history(email_history, source, batch_size, save_every):
+    start = time.monotonic()
+    seen = 0
+
+    def counted(emails):
+        nonlocal seen
+        for email in emails:
+            seen += 1
+            if seen % 1000 == 0:
+                elapsed = time.monotonic() - start
+                logging.info(f"Read {seen} messages ({seen / elapsed:.1f} msg/s)")
+            yield email
+
+    added = email_history.add_emails(counted(iter_emails(source)), batch_size=batch_size, save_every=save_every)
+    elapsed = time.monotonic() - start
+    logging.info(f"Loaded {added} new of {seen} messages into email history in {elapsed:.1f}s "
+                 f"({seen / elapsed if elapsed else 0:.1f} msg/s)")
+
+class BulkProcessor:
+    def __init__(self, pipeline, output_dir, checkpoint, workers=4, checkpoint_every=25):
+        self.pipeline = pipeline
+        self.output_dir = output_dir
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.checkpoint_every = checkpoint_every
+        self.lock = threading.Lock()
+        self.stats = {'drafted': 0, 'short': 0, 'failed': 0, 'skipped': 0}
+
+    def process_one(self, email):
+        # The archive is already in the email history, so keep the email from matching itself
+        response = self.pipeline.process_email(email['subject'], email['body'], email['sender'], email['id'])
+        if not response:
+            logging.warning(f"No valid response generated for email: {email['subject']}")
+            return 'failed'
+        if len(response.split()) <= MIN_RESPONSE_WORDS:
+            logging.warning(f"Response too short for email: {email['subject']}")
+            return 'short'
+        path = write_draft(self.output_dir, email, response)
+        logging.info(f"Wrote draft for email: {email['subject']} to {path}")
+        return 'drafted'
+
+    def unprocessed(self, emails):
+        for email in emails:
+            if self.checkpoint.is_processed(email['id']):
+                self.stats['skipped'] += 1
+                continue
+            yield email
+
+    def _record(self, email, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+            if outcome == 'drafted':
+                # Only drafted emails are checkpointed, so failures are retried on the next run like in main.py
+                self.checkpoint.processed_ids.add(email['id'])
+                if self.stats['drafted'] % self.checkpoint_every == 0:
+                    self.checkpoint.save_processed_ids()
+
+    def _run_one(self, email):
+        try:
+            outcome = self.process_one(email)
+        except Exception as e:
+            logging.error(f"Error processing email {email['subject']}: {str(e)}")
+            outcome = 'failed'
+        self._record(email, outcome)
+
+    def run(self, emails):
+        os.makedirs(self.output_dir, exist_ok=True)
+        start = time.monotonic()
+        done = 0
+        pending = set()
+        # Keep a bounded number of emails in flight so the archive is streamed, not read into memory
+        max_pending = self.workers * 2
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for email in emails:
+                    if len(pending) >= max_pending:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        done += len(finished)
+                        self._log_progress(done, start)
+                    pending.add(executor.submit(self._run_one, email))
+                done += len(pending)
+                wait(pending)
+        finally:
+            # The executor finishes queued emails even on Ctrl-C, so record them before exiting
+            self.checkpoint.save_processed_ids()
+
+        elapsed = time.monotonic() - start
+        logging.info(f"Processed {done} emails in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.2f} msg/s): "
+                     f"{self.stats['drafted']} drafted, {self.stats['short']} too short, "
+                     f"{self.stats['failed']} failed, {self.stats['skipped']} already in checkpoint")
+        return self.stats
+
+    def _log_progress(self, done, start):
+        if done and done % 10 == 0:
+            elapsed = time.monotonic() - start
+            logging.info(f"Processed {done} emails ({done / elapsed:.2f} msg/s)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-process an mbox file or a directory of .eml files.")
+    parser.add_argument('source', help="mbox file or directory containing .eml files")
+    parser.add_argument('--output-dir', default='drafts', help="directory to write draft .eml files to")
+    parser.add_argument('--checkpoint', help="checkpoint file of drafted message IDs (default: OUTPUT_DIR/checkpoint.json)")
+    parser.add_argument('--workers', type=int, default=4, help="number of emails processed in parallel")
+    parser.add_argument('--mode', choices=['full', 'fast'], default=PIPELINE_MODE, help="processing pipeline mode")
+    parser.add_argument('--batch-size', type=int, default=100, help="emails embedded per request when loading history")
+    parser.add_argument('--save-every', type=int, default=10,
+                        help="minimum batches between saves of the history index; the gap grows with the index")
+    parser.add_argument('--skip-load', action='store_true', help="don't load the archive into email history")
+    parser.add_argument('--load-only', action='store_true', help="only load the archive into email history")
+    parser.add_argument('--since', type=lambda s: datetime.strptime(s, "%Y-%m-%d"), help="only process emails on or after YYYY-MM-DD")
+    parser.add_argument('--sender', help="only process emails whose sender contains this text")
+    parser.add_argument('--subject', help="only process emails whose subject matches this regular expression")
+    parser.add_argument('--limit', type=int, help="process at most this many selected emails")
+    parser.add_argument('--include-own', action='store_true', help="also process emails sent from EMAIL_ADDRESS")
+    args = parser.parse_args(argv)
+    if args.skip_load and args.load_only:
+        parser.error("--skip-load and --load-only can't be used together")
+    if args.batch_size < 1 or args.save_every < 1 or args.workers < 1:
+        parser.error("--batch-size, --save-every and --workers must be at least 1")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    email_history = EmailHistory()
+
+    if not args.skip_load:
+        load_history(email_history, args.source, args.batch_size, args.save_every)
+    if args.load_only:
+        return
+
+    knowledge_base = KnowledgeBase()
+    pipeline = ProcessingPipeline(knowledge_base, mode=args.mode, email_history=email_history)
+    checkpoint = ProcessedEmails(args.checkpoint or os.path.join(args.output_dir, 'checkpoint.json'))
+    processor = BulkProcessor(pipeline, args.output_dir, checkpoint, workers=args.workers)
+
+    logging.info(f"Processing emails from {args.source} with {args.workers} workers in '{args.mode}' mode")
+    # Drop already drafted emails before selecting, so --limit picks up where the last run stopped
+    emails = select_emails(processor.unprocessed(iter_emails(args.source)), since=args.since, sender=args.sender,
+                           subject=args.subject, limit=args.limit,
+                           exclude_sender=None if args.include_own else EMAIL_ADDRESS)
+    processor.run(emails)
+
+if __name__ == "__main__":
+    main()
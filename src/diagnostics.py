@@ -0,0 +1,400 @@
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import itertools
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+from config import (
+    DIAGNOSTICS_DIR, DIAGNOSTICS_PORT, DIAGNOSTICS_PROFILE_SECONDS, DIAGNOSTICS_SAMPLE_INTERVAL,
+    DIAGNOSTICS_TRACEMALLOC_FRAMES, DIAGNOSTICS_TRACEMALLOC_SECONDS, DIAGNOSTICS_MAX_PROFILE_SECONDS,
+    DIAGNOSTICS_MIN_SAMPLE_INTERVAL, DIAGNOSTICS_MAX_SAMPLE_INTERVAL
+)
+
+class RuntimeDiagnostics:
+    """On-demand profiling and memory introspection for the running service.
+
+    SIGUSR1 captures a sampling profile of the main thread. SIGUSR2 writes a memory report and,
+    if tracemalloc isn't running, starts it for DIAGNOSTICS_TRACEMALLOC_SECONDS, so later reports
+    include a snapshot diff; when that time is up a final report is written and tracing stops.
+    If DIAGNOSTICS_PORT is set, the same actions are served on 127.0.0.1 at /profile, /memory,
+    /tracemalloc/start and /tracemalloc/stop. Every result is written to DIAGNOSTICS_DIR.
+    """
+
+    DEFAULT_TRACEMALLOC_FRAMES = 25
+
+    def __init__(self, knowledge_base=None, processing_pipeline=None, gmail_monitor=None,
+                 output_dir=DIAGNOSTICS_DIR, port=DIAGNOSTICS_PORT):
+        self.knowledge_base = knowledge_base
+        self.processing_pipeline = processing_pipeline
+        self.gmail_monitor = gmail_monitor
+        self.output_dir = output_dir
+        self.port = port
+        self.main_thread_id = threading.main_thread().ident
+        self.profile_lock = threading.Lock()
+        self.memory_lock = threading.Lock()
+        self.last_snapshot = None
+        self.tracemalloc_timer = None
+        self.output_counter = itertools.count(1)
+        self.server = None
+
+    def install(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if DIAGNOSTICS_TRACEMALLOC_FRAMES > 0:
+            self.start_tracemalloc(DIAGNOSTICS_TRACEMALLOC_FRAMES)
+
+        # SIGUSR1/SIGUSR2 don't exist on Windows, use the control endpoint there
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self._run_in_background(self.capture_profile))
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self._run_in_background(self.capture_memory_report, True))
+            logging.info(f"Diagnostics: send SIGUSR1 to profile, SIGUSR2 for a memory report (pid {os.getpid()})")
+
+        if self.port:
+            try:
+                self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self._make_handler())
+            except OSError as e:
+                # Diagnostics are optional, never let them stop the mail loop
+                logging.error(f"Could not start diagnostics endpoint on port {self.port}, continuing without it: {e}")
+            else:
+                threading.Thread(target=self.server.serve_forever, name='diagnostics-server', daemon=True).start()
+                logging.info(f"Diagnostics endpoint listening on http://127.0.0.1:{self.port}")
+
+        logging.info(f"Diagnostics output directory: {self.output_dir}")
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+            self.server = None
+
+    def _make_handler(self):
+        return _make_handler_class(self)
+
+    def _run_in_background(self, target, *args):
+        # Signal handlers run on the main thread, so hand the work off instead of blocking the loop
+        threading.Thread(target=target, args=args, name='diagnostics-worker', daemon=True).start()
+
+    def _output_path(self, prefix, extension):
+        # The counter keeps files captured within the same second from overwriting each other
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.output_dir, f"{prefix}_{timestamp}-{next(self.output_counter):04d}.{extension}")
+
+    # Profiling
+
+    def capture_profile(self, seconds=DIAGNOSTICS_PROFILE_SECONDS, interval=DIAGNOSTICS_SAMPLE_INTERVAL):
+        """Sample the main thread's stack for `seconds` and write a summary and collapsed stacks."""
+        error = profile_args_error(seconds, interval)
+        if error:
+            logging.error(f"Not capturing profile: {error}")
+            return None
+        if not self.profile_lock.acquire(blocking=False):
+            logging.warning("A profile is already being captured, ignoring request")
+            return None
+        try:
+            logging.info(f"Capturing {seconds}s sampling profile of the main thread")
+            stacks = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(self.main_thread_id)
+                if frame is not None:
+                    stacks[self._stack_key(frame)] += 1
+                    samples += 1
+                del frame
+                time.sleep(interval)
+
+            summary_path = self._output_path('profile', 'txt')
+            collapsed_path = summary_path[:-len('.txt')] + '.collapsed'
+            with open(collapsed_path, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{';'.join(stack)} {count}\n")
+            with open(summary_path, 'w') as f:
+                f.write(self._format_profile_summary(stacks, samples, seconds, interval))
+
+            logging.info(f"Profile written to {summary_path} and {collapsed_path}")
+            return summary_path
+        except Exception as e:
+            logging.error(f"Error capturing profile: {e}")
+            return None
+        finally:
+            self.profile_lock.release()
+
+    @staticmethod
+    def _stack_key(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    @staticmethod
+    def _format_profile_summary(stacks, samples, seconds, interval, top=40):
+        own = Counter()
+        total = Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+
+        lines = [
+            f"Sampling profile of the main thread: {samples} samples over {seconds}s (interval {interval}s)",
+            "",
+            f"Top {top} functions by own samples:",
+        ]
+        for function, count in own.most_common(top):
+            lines.append(f"{count:8d} {100.0 * count / max(samples, 1):6.1f}%  {function}")
+        lines += ["", f"Top {top} functions by cumulative samples:"]
+        for function, count in total.most_common(top):
+            lines.append(f"{count:8d} {100.0 * count / max(samples, 1):6.1f}%  {function}")
+        return "\n".join(lines) + "\n"
+
+    # Memory
+
+    def start_tracemalloc(self, frames=DEFAULT_TRACEMALLOC_FRAMES, seconds=None):
+        """Start tracing allocations and take the baseline snapshot. Returns False if already tracing.
+
+        With `seconds`, a final memory report is written after that long and tracing stops.
+        """
+        with self.memory_lock:
+            if tracemalloc.is_tracing():
+                return False
+            tracemalloc.start(frames)
+            self.last_snapshot = tracemalloc.take_snapshot()
+            if seconds is not None:
+                self.tracemalloc_timer = threading.Timer(seconds, self._finish_tracemalloc)
+                self.tracemalloc_timer.daemon = True
+                self.tracemalloc_timer.start()
+                logging.info(f"tracemalloc started with {frames} frames for {seconds}s")
+            else:
+                logging.info(f"tracemalloc started with {frames} frames")
+            return True
+
+    def stop_tracemalloc(self):
+        """Stop tracing allocations and drop the saved snapshot. Returns False if not tracing."""
+        with self.memory_lock:
+            if self.tracemalloc_timer is not None:
+                self.tracemalloc_timer.cancel()
+                self.tracemalloc_timer = None
+            if not tracemalloc.is_tracing():
+                return False
+            tracemalloc.stop()
+            self.last_snapshot = None
+            logging.info("tracemalloc stopped")
+            return True
+
+    def _finish_tracemalloc(self):
+        # Ignore a timer that fired after tracing was stopped or restarted by someone else
+        if threading.current_thread() is not self.tracemalloc_timer:
+            return
+        self._capture_memory_report()
+        self.stop_tracemalloc()
+
+    def capture_memory_report(self, start_tracing=False):
+        """Write component sizes as JSON and, if tracemalloc is on, the diff since the last snapshot.
+
+        With `start_tracing`, tracemalloc is started after the report if it wasn't running, and
+        stops again after DIAGNOSTICS_TRACEMALLOC_SECONDS.
+        """
+        path = self._capture_memory_report()
+        if start_tracing and not tracemalloc.is_tracing():
+            self.start_tracemalloc(seconds=DIAGNOSTICS_TRACEMALLOC_SECONDS)
+        return path
+
+    def _capture_memory_report(self):
+        with self.memory_lock:
+            try:
+                report = {
+                    'timestamp': datetime.now().isoformat(),
+                    'process': process_memory(),
+                    'components': self.component_sizes(),
+                }
+                report_path = self._output_path('memory', 'json')
+
+                if tracemalloc.is_tracing():
+                    snapshot = tracemalloc.take_snapshot()
+                    diff_path = self._output_path('tracemalloc', 'txt')
+                    self._write_tracemalloc_diff(snapshot, diff_path)
+                    self.last_snapshot = snapshot
+                    current, peak = tracemalloc.get_traced_memory()
+                    report['tracemalloc'] = {'current_bytes': current, 'peak_bytes': peak, 'diff_file': diff_path}
+                else:
+                    report['tracemalloc'] = None
+
+                with open(report_path, 'w') as f:
+                    json.dump(report, f, indent=2)
+                logging.info(f"Memory report written to {report_path}")
+                return report_path
+            except Exception as e:
+                logging.error(f"Error capturing memory report: {e}")
+                return None
+
+    def _write_tracemalloc_diff(self, snapshot, path, top=50):
+        snapshot = _filter_snapshot(snapshot)
+        with open(path, 'w') as f:
+            if self.last_snapshot is None:
+                f.write(f"No previous snapshot, top {top} allocation sites:\n")
+                stats = snapshot.statistics('lineno')
+            else:
+                f.write(f"Top {top} changes since the previous snapshot:\n")
+                stats = snapshot.compare_to(_filter_snapshot(self.last_snapshot), 'lineno')
+            for stat in stats[:top]:
+                f.write(f"{stat}\n")
+            f.write("\nTop 10 allocation tracebacks:\n")
+            for stat in snapshot.statistics('traceback')[:10]:
+                f.write(f"\n{stat.count} blocks, {stat.size / 1024:.1f} KiB\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
+
+    def component_sizes(self):
+        sizes = {}
+        kb = self.knowledge_base
+        if kb is not None:
+            sizes['knowledge_base.bi_encoder'] = model_nbytes(kb.bi_encoder)
+            sizes['knowledge_base.document_embeddings'] = tensor_nbytes(kb.document_embeddings)
+            sizes['knowledge_base.tfidf_matrix'] = sparse_nbytes(kb.tfidf_matrix)
+            sizes['knowledge_base.text_chunks'] = len(kb.texts)
+
+        pipeline = self.processing_pipeline
+        if pipeline is not None:
+            summarizer = getattr(pipeline, 'email_summarizer', None)
+            if summarizer is not None:
+                sizes['pipeline.email_summarizer.model'] = model_nbytes(summarizer.summarizer.model)
+            sizes['pipeline.email_history.faiss_index'] = faiss_index_info(pipeline.email_history.vector_store)
+
+        if self.gmail_monitor is not None:
+            sizes['gmail_monitor.email_history.faiss_index'] = faiss_index_info(self.gmail_monitor.email_history.vector_store)
+        return sizes
+
+def _filter_snapshot(snapshot):
+    return snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+
+def profile_args_error(seconds, interval):
+    """Why a profile can't run with these arguments, or None if it can."""
+    # Comparisons are written so that nan fails them too
+    if not 0 < seconds <= DIAGNOSTICS_MAX_PROFILE_SECONDS:
+        return f"seconds must be in (0, {DIAGNOSTICS_MAX_PROFILE_SECONDS}]"
+    if not DIAGNOSTICS_MIN_SAMPLE_INTERVAL <= interval <= DIAGNOSTICS_MAX_SAMPLE_INTERVAL:
+        return f"interval must be in [{DIAGNOSTICS_MIN_SAMPLE_INTERVAL}, {DIAGNOSTICS_MAX_SAMPLE_INTERVAL}]"
+    return None
+
+def process_memory():
+    info = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    info[key] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # ru_maxrss is kilobytes on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        info['max_rss_bytes'] = max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return info
+
+def tensor_nbytes(tensor):
+    if tensor is None:
+        return None
+    if hasattr(tensor, 'element_size'):
+        return tensor.element_size() * tensor.nelement()
+    return getattr(tensor, 'nbytes', None)
+
+def sparse_nbytes(matrix):
+    if matrix is None:
+        return None
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+def model_nbytes(model):
+    """Bytes held by a torch module's parameters and buffers."""
+    if model is None or not hasattr(model, 'parameters'):
+        return None
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.element_size() * t.nelement() for t in tensors)
+
+def faiss_index_info(vector_store):
+    index = getattr(vector_store, 'index', None)
+    if index is None:
+        return None
+    info = {'type': type(index).__name__, 'vectors': index.ntotal, 'dimension': index.d}
+    # Computed from the code size rather than by serializing, which would copy every vector
+    try:
+        code_size = index.sa_code_size()
+    except Exception:
+        # Flat float32 storage, which is what the langchain FAISS store builds
+        code_size = index.d * 4
+    info['bytes'] = index.ntotal * code_size
+    docstore = getattr(getattr(vector_store, 'docstore', None), '_dict', None)
+    if docstore is not None:
+        info['docstore_text_bytes'] = sum(sys.getsizeof(doc.page_content) for doc in docstore.values())
+    return info
+
+def _make_handler_class(diagnostics):
+    class DiagnosticsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path == '/profile':
+                try:
+                    seconds = float(params.get('seconds', [DIAGNOSTICS_PROFILE_SECONDS])[0])
+                except ValueError:
+                    self._reply(400, {'error': 'seconds must be a number'})
+                    return
+                error = profile_args_error(seconds, DIAGNOSTICS_SAMPLE_INTERVAL)
+                if error:
+                    self._reply(400, {'error': error})
+                    return
+                if diagnostics.profile_lock.locked():
+                    self._reply(409, {'error': 'a profile is already being captured'})
+                    return
+                diagnostics._run_in_background(diagnostics.capture_profile, seconds)
+                self._reply(202, {'status': 'profiling', 'seconds': seconds, 'output_dir': diagnostics.output_dir})
+            elif url.path == '/tracemalloc/start':
+                try:
+                    frames = int(params.get('frames', [RuntimeDiagnostics.DEFAULT_TRACEMALLOC_FRAMES])[0])
+                except ValueError:
+                    self._reply(400, {'error': 'frames must be an integer'})
+                    return
+                if frames < 1:
+                    self._reply(400, {'error': 'frames must be at least 1'})
+                    return
+                started = diagnostics.start_tracemalloc(frames)
+                self._reply(200, {'status': 'started' if started else 'already tracing'})
+            elif url.path == '/tracemalloc/stop':
+                stopped = diagnostics.stop_tracemalloc()
+                self._reply(200, {'status': 'stopped' if stopped else 'not tracing'})
+            elif url.path == '/memory':
+                path = diagnostics.capture_memory_report()
+                if path:
+                    self._reply(200, {'status': 'ok', 'report': path})
+                else:
+                    self._reply(500, {'error': 'memory report failed, see the service log'})
+            else:
+                self._reply(404, {'error': 'unknown endpoint, use /profile, /memory, /tracemalloc/start or /tracemalloc/stop'})
+
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            logging.info(f"Diagnostics endpoint: {format % args}")
+
+    return DiagnosticsRequestHandler
@@ -61,14 +61,99 @@ class EmailHistory:
         conn.commit()
         conn.close()
 
-    def search_similar_emails(self, query, k=3):
-        results = self.vector_store.similarity_search_with_score(query, k=k)
+    def add_emails(self, emails, batch_size=100, save_every=10):
+        """Bulk-load emails given as dicts with the same fields as add_email. Returns the number added.
+
+        Each batch is embedded with one call, so loading a whole mailbox doesn't pay for an embedding
+        request and a database connection per email. Rows are only written once the vector store
+        holding their vectors has been saved, so a load that stops partway leaves no row without
+        its vector and the missing emails are loaded again on the next run. Saves happen at least
+        `save_every` batches apart, and the gap grows with the index so the total written stays
+        linear in its size. Rows are inserted in short transactions, but don't run a load alongside
+        the service: both write the same database and vector store files.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            saved_rows = conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+        finally:
+            conn.close()
+
+        added = 0
+        pending_rows = []
+        pending_ids = set()
+        batch = []
+        for email in emails:
+            batch.append(email)
+            if len(batch) >= batch_size:
+                added += self._add_email_batch(batch, pending_rows, pending_ids)
+                batch = []
+                if len(pending_rows) >= max(save_every * batch_size, saved_rows):
+                    saved_rows += self._save_pending(pending_rows, pending_ids)
+        if batch:
+            added += self._add_email_batch(batch, pending_rows, pending_ids)
+        if pending_rows:
+            self._save_pending(pending_rows, pending_ids)
+        return added
+
+    def _add_email_batch(self, batch, pending_rows, pending_ids):
+        ids = [email['id'] for email in batch]
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(f"SELECT id FROM emails WHERE id IN ({','.join('?' * len(ids))})", ids)
+            seen = {row[0] for row in cursor.fetchall()} | pending_ids
+        finally:
+            conn.close()
+
+        new_emails = []
+        for email in batch:
+            if email['id'] not in seen:
+                seen.add(email['id'])
+                new_emails.append(email)
+        if not new_emails:
+            return 0
+
+        vector_ids = self.vector_store.add_texts(
+            [email['body'] for email in new_emails],
+            metadatas=[{"email_id": email['id']} for email in new_emails]
+        )
+        for email, vector_id in zip(new_emails, vector_ids):
+            pending_rows.append((email['id'], email['sender'], email['recipient'], email['subject'],
+                                 email['body'], email['date'], email['thread_id'], vector_id))
+            pending_ids.add(email['id'])
+        return len(new_emails)
+
+    def _save_pending(self, pending_rows, pending_ids):
+        # Save vectors before writing rows: a crash in between leaves vectors without rows,
+        # which are re-added on the next run, rather than rows whose vectors are lost for good
+        self.save_vector_store()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany('''
+                INSERT INTO emails (id, sender, recipient, subject, body, date, thread_id, vector_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', pending_rows)
+            conn.commit()
+        finally:
+            conn.close()
+        saved = len(pending_rows)
+        pending_rows.clear()
+        pending_ids.clear()
+        return saved
+
+    def search_similar_emails(self, query, k=3, exclude_id=None):
+        # An interrupted bulk load can leave a second vector for the same email, so over-fetch
+        # enough to still return k distinct emails after dropping duplicates and exclude_id
+        results = self.vector_store.similarity_search_with_score(query, k=2 * k + 2)
         similar_emails = []
+        seen_ids = set()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         for doc, score in results:
+            if len(similar_emails) >= k:
+                break
             email_id = doc.metadata.get('email_id')
-            if email_id:
+            if email_id and email_id != exclude_id and email_id not in seen_ids:
+                seen_ids.add(email_id)
                 cursor.execute("SELECT * FROM emails WHERE id = ?", (email_id,))
                 email_data = cursor.fetchone()
                 if email_data:
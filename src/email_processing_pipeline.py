@@ -1,21 +1,43 @@
+import re
 import logging
+from collections import Counter
 from datetime import datetime
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from config import OPENAI_API_KEY, EMAIL_ADDRESS
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from config import (
+    OPENAI_API_KEY, EMAIL_ADDRESS, PIPELINE_MODE, MIN_RESPONSE_WORDS,
+    FAST_PATH_KB_CHAR_BUDGET, FAST_PATH_HISTORY_CHAR_BUDGET, FAST_PATH_QUERY_KEYWORDS
+)
 from src.email_history import EmailHistory
 from transformers import pipeline
 
+REQUIRED_SECTIONS = [
+    "# Context Summary",
+    "# Knowledge Base Insights",
+    "# Relevant Email History",
+    "# Draft Response",
+]
+
 class ProcessingPipeline:
-    def __init__(self, knowledge_base):
-        self.query_generator = QueryGenerationAgent()
+    def __init__(self, knowledge_base, mode=PIPELINE_MODE, email_history=None):
+        if mode not in ('full', 'fast'):
+            raise ValueError(f"Unknown pipeline mode: {mode}")
+        self.mode = mode
         self.kb_searcher = KnowledgeBaseSearchAgent(knowledge_base)
         self.response_generator = ResponseGenerationAgent()
-        self.email_history = EmailHistory()
+        self.email_history = email_history or EmailHistory()
         self.final_reviewer = FinalReviewAgent()
-        self.email_summarizer = EmailSummarizer()
-
-    def process_email(self, subject, body, sender):
+        if self.mode == 'fast':
+            # The fast path never calls the query LLM or the BART summarizer, so don't load them
+            self.query_builder = KeywordQueryBuilder()
+        else:
+            self.query_generator = QueryGenerationAgent()
+            self.email_summarizer = EmailSummarizer()
+
+    def process_email(self, subject, body, sender, email_id=None):
+        if self.mode == 'fast':
+            return self.process_email_fast(subject, body, sender, email_id)
         try:
             query = self.query_generator.generate_query(subject, body)
             logging.info(f"Generated query: {query}")
@@ -23,7 +45,7 @@ class ProcessingPipeline:
             kb_summary = self.kb_searcher.search_and_summarize(query)
             logging.info(f"Knowledge base summary: {kb_summary}")
 
-            similar_emails = self.email_history.search_similar_emails(query)
+            similar_emails = self.email_history.search_similar_emails(query, exclude_id=email_id)
             email_history_summary = self.email_summarizer.summarize_emails(similar_emails)
             logging.info(f"Email history summary: {email_history_summary}")
 
@@ -39,6 +61,117 @@ class ProcessingPipeline:
             logging.error(f"Error in processing pipeline: {e}")
             return None
 
+    def process_email_fast(self, subject, body, sender, email_id=None):
+        try:
+            query = self.query_builder.build_query(subject, body)
+            logging.info(f"Built query: {query}")
+
+            kb_context = format_kb_context(self.kb_searcher.search(query), FAST_PATH_KB_CHAR_BUDGET)
+            similar_emails = self.email_history.search_similar_emails(query, exclude_id=email_id)
+            email_history_context = format_email_history_context(similar_emails, FAST_PATH_HISTORY_CHAR_BUDGET)
+
+            response = self.response_generator.generate_response_from_context(
+                subject, body, kb_context, email_history_context, sender
+            )
+
+            problems = check_response(response)
+            if problems == ["empty response"]:
+                # Nothing to review, and a reviewer asked to fill a blank would make the draft up
+                logging.warning("Response generation returned an empty response")
+                return None
+            if problems:
+                logging.info(f"Local checks failed ({'; '.join(problems)}), running final review")
+                response = self.final_reviewer.review_fast_response(
+                    subject, body, response, kb_context, email_history_context, problems
+                )
+            else:
+                logging.info("Local checks passed, skipping final review")
+
+            logging.info(f"Final response generated: {response[:500]}...")
+            return response
+        except Exception as e:
+            logging.error(f"Error in fast processing pipeline: {e}")
+            return None
+
+def _truncate(text, budget):
+    if len(text) <= budget:
+        return text
+    return text[:budget].rsplit(' ', 1)[0] + " ..."
+
+def format_kb_context(documents, char_budget):
+    """Concatenate knowledge base chunks in rank order until the character budget is spent."""
+    parts = []
+    remaining = char_budget
+    for i, doc in enumerate(documents, 1):
+        if remaining <= 0:
+            break
+        source = doc.metadata.get('source', 'Unknown')
+        page = doc.metadata.get('page')
+        citation = f"{source}, page {page + 1}" if isinstance(page, int) else source
+        content = _truncate(doc.page_content.strip(), remaining)
+        remaining -= len(content)
+        parts.append(f"[{i}] ({citation})\n{content}")
+    return "\n\n".join(parts) if parts else "No relevant knowledge base content found."
+
+def format_email_history_context(emails, char_budget):
+    """Render similar past emails as raw text, sharing the character budget between them."""
+    emails = emails[:3]
+    if not emails:
+        return "No relevant email history found."
+    per_email_budget = char_budget // len(emails)
+    parts = []
+    for email in emails:
+        body = _truncate((email.get('body') or '').strip(), per_email_budget)
+        parts.append(
+            f"**Date:** {email.get('date', 'Unknown')}\n**Sender:** {email.get('sender', 'Unknown')}\n"
+            f"**Subject:** {email.get('subject', 'No Subject')}\n{body}\n"
+        )
+    return "\n".join(parts)
+
+def check_response(response):
+    """Cheap local checks on a generated response. Returns a list of problems, empty if it passes."""
+    if not response:
+        return ["empty response"]
+    problems = []
+    lines = [line.strip() for line in response.splitlines()]
+    for section in REQUIRED_SECTIONS:
+        if not any(line.startswith(section) for line in lines):
+            problems.append(f"missing section '{section}'")
+    word_count = len(response.split())
+    if word_count <= MIN_RESPONSE_WORDS:
+        problems.append(f"only {word_count} words")
+    return problems
+
+class KeywordQueryBuilder:
+    """Builds a knowledge base query from the email itself, without an LLM call."""
+
+    WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9'\-]+")
+    EXTRA_STOP_WORDS = {
+        "hi", "hello", "dear", "thanks", "thank", "regards", "best", "kind", "sincerely",
+        "cheers", "please", "re", "fw", "fwd", "wrote", "sent", "email", "just", "like", "know",
+    }
+
+    def __init__(self, max_keywords=FAST_PATH_QUERY_KEYWORDS):
+        self.max_keywords = max_keywords
+        self.stop_words = ENGLISH_STOP_WORDS.union(self.EXTRA_STOP_WORDS)
+
+    def extract_keywords(self, text):
+        words = [w.lower().strip("'-") for w in self.WORD_PATTERN.findall(text)]
+        return [w for w in words if len(w) > 2 and w not in self.stop_words]
+
+    def build_query(self, subject, body):
+        subject_keywords = self.extract_keywords(subject)
+        counts = Counter(self.extract_keywords(body))
+        # Subject terms usually name the topic, so weight them above body terms
+        for word in subject_keywords:
+            counts[word] += 3
+        first_seen = {}
+        for i, word in enumerate(subject_keywords + self.extract_keywords(body)):
+            first_seen.setdefault(word, i)
+        ranked = sorted(counts, key=lambda w: (-counts[w], first_seen[w]))
+        keywords = sorted(ranked[:self.max_keywords], key=lambda w: first_seen[w])
+        return " ".join(keywords) if keywords else subject
+
 class QueryGenerationAgent:
     def __init__(self):
         self.llm = ChatOpenAI(temperature=0.7, openai_api_key=OPENAI_API_KEY)
@@ -83,8 +216,11 @@ class KnowledgeBaseSearchAgent:
             Please provide a concise summary of the most relevant information:"""
         )
 
+    def search(self, query):
+        return self.knowledge_base.query(query)
+
     def search_and_summarize(self, query):
-        search_results = self.knowledge_base.query(query)
+        search_results = self.search(query)
         search_results_text = "\n".join([doc.page_content for doc in search_results])
         response = self.llm(self.prompt.format_messages(query=query, search_results=search_results_text))
         logging.info(f"Knowledge base search summary: {response.content}")
@@ -132,6 +268,42 @@ class ResponseGenerationAgent:
 
             Generated response:"""
         )
+        self.fast_response_prompt = ChatPromptTemplate.from_template(
+            """You are an AI assistant with email address {ai_email}. Your role is to create professional email responses.
+
+            Consider the following when crafting your response:
+            1. Maintain a professional and helpful tone.
+            2. Address all points raised in the original email.
+            3. Use only the knowledge base excerpts and past emails below that are relevant to the email; ignore the rest.
+            4. Cite knowledge base excerpts by their [number] and source.
+            5. Ensure the response is clear, concise, and well-structured.
+
+            Original Email Subject: {subject}
+            Original Email Body: {body}
+            Sender's Email: {sender_email}
+
+            Knowledge Base Excerpts:
+            {kb_context}
+
+            Similar Past Emails:
+            {email_history_context}
+
+            Please generate a professional email response following this exact structure with Markdown formatting:
+
+            # Context Summary
+            [Is this a new conversation or a continuation? Briefly summarize the email context]
+
+            # Knowledge Base Insights
+            [List key insights from the knowledge base excerpts, with citations]
+
+            # Relevant Email History
+            [Summarize the relevant past emails, with their dates and senders, or state that there are none]
+
+            # Draft Response
+            [Generate the actual email response here]
+
+            Generated response:"""
+        )
 
     def generate_response(self, subject, body, kb_summary, email_history_summary, sender_email):
         context_summary = self.llm(self.context_prompt.format_messages(
@@ -150,6 +322,16 @@ class ResponseGenerationAgent:
 
         return response
 
+    def generate_response_from_context(self, subject, body, kb_context, email_history_context, sender_email):
+        return self.llm(self.fast_response_prompt.format_messages(
+            subject=subject,
+            body=body,
+            kb_context=kb_context,
+            email_history_context=email_history_context,
+            ai_email=EMAIL_ADDRESS,
+            sender_email=sender_email
+        )).content
+
 class FinalReviewAgent:
     def __init__(self):
         self.llm = ChatOpenAI(temperature=0.3, openai_api_key=OPENAI_API_KEY)
@@ -170,6 +352,44 @@ class FinalReviewAgent:
 
             Refined response:"""
         )
+        self.fast_prompt = ChatPromptTemplate.from_template(
+            """You are an AI assistant responsible for reviewing and repairing email responses. The response below failed these checks: {problems}.
+
+            The response must strictly maintain the following structure with Markdown formatting:
+            # Context Summary
+            # Knowledge Base Insights (with citations)
+            # Relevant Email History
+            # Draft Response
+
+            Use only the original email, the knowledge base excerpts and the past emails below. If they don't contain the information a section needs, say so in that section rather than inventing it.
+
+            Original Email Subject: {subject}
+            Original Email Body: {body}
+
+            Knowledge Base Excerpts:
+            {kb_context}
+
+            Similar Past Emails:
+            {email_history_context}
+
+            Initial response:
+            {initial_response}
+
+            Please repair the response so it passes the checks, keeping what is already correct. The final response should be concise but informative.
+
+            Refined response:"""
+        )
+
+    def review_fast_response(self, subject, body, initial_response, kb_context, email_history_context, problems):
+        response = self.llm(self.fast_prompt.format_messages(
+            problems="; ".join(problems),
+            subject=subject,
+            body=body,
+            kb_context=kb_context,
+            email_history_context=email_history_context,
+            initial_response=initial_response
+        ))
+        return response.content
 
     def review_response(self, query, initial_response, kb_summary, email_history_summary):
         response = self.llm(self.prompt.format_messages(
@@ -3,16 +3,20 @@ import logging
 from src.email_integration import GmailMonitor
 from src.knowledge_base import KnowledgeBase
 from src.email_processing_pipeline import ProcessingPipeline
-from config import USE_LOCAL_LLM
+from src.diagnostics import RuntimeDiagnostics
+from config import USE_LOCAL_LLM, PIPELINE_MODE, MIN_RESPONSE_WORDS
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 async def main():
     try:
         logging.info(f"Using {'Local LLM' if USE_LOCAL_LLM.lower() == 'true' else 'OpenAI'} for processing")
+        logging.info(f"Using '{PIPELINE_MODE}' pipeline mode")
         gmail_monitor = GmailMonitor()
         knowledge_base = KnowledgeBase()
         processing_pipeline = ProcessingPipeline(knowledge_base)
+        diagnostics = RuntimeDiagnostics(knowledge_base, processing_pipeline, gmail_monitor)
+        diagnostics.install()
 
         # Initial fetch of email history
         gmail_monitor.fetch_email_history()
@@ -25,11 +29,11 @@ async def main():
             for subject, body, message_id, sender in new_emails:
                 logging.info(f"Processing email: {subject}")
                 try:
-                    final_response = processing_pipeline.process_email(subject, body, sender)
+                    final_response = processing_pipeline.process_email(subject, body, sender, message_id)
                     if final_response:
                         logging.info(f"Final response generated:\n{final_response[:500]}...")
                         
-                        if len(final_response.split()) > 50:
+                        if len(final_response.split()) > MIN_RESPONSE_WORDS:
                             draft_id = gmail_monitor.create_draft(message_id, final_response, sender, subject)
                             if draft_id:
                                 gmail_monitor.apply_ai_drafted_label(message_id)
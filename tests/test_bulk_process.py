@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import mailbox
+import tempfile
+import unittest
+from datetime import datetime
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from config import MIN_RESPONSE_WORDS
+from src.bulk_process import BulkProcessor, draft_path, iter_emails, parse_message, select_emails
+from src.email_processing import ProcessedEmails
+
+def make_message(sender, subject, date=None, message_id=None, references=None, body="Hello"):
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = 'Support <support@example.com>'
+    message['Subject'] = subject
+    if date:
+        message['Date'] = date
+    if message_id:
+        message['Message-ID'] = message_id
+    if references:
+        message['References'] = references
+    message.set_content(body)
+    return message
+
+class BulkProcessTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mbox_path = os.path.join(self.tmp.name, 'archive.mbox')
+        mbox = mailbox.mbox(self.mbox_path)
+        mbox.add(make_message('Alice <alice@example.com>', 'Pricing question',
+                              date='Mon, 14 Oct 2024 10:00:00 +0000', message_id='<a1@example.com>'))
+        mbox.add(make_message('Bob <bob@example.com>', 'Re: Pricing question',
+                              date='Tue, 15 Oct 2024 10:00:00 +0000', message_id='<b1@example.com>',
+                              references='<a1@example.com> <x@example.com>'))
+        mbox.add(make_message('carol@example.com', 'No date or id'))
+        mbox.add(make_message('Support <support@example.com>', 'Our reply',
+                              date='Wed, 16 Oct 2024 10:00:00 +0000', message_id='<s1@example.com>'))
+        mbox.flush()
+        mbox.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_messages(self):
+        emails = list(iter_emails(self.mbox_path))
+        self.assertEqual(len(emails), 4)
+
+        alice, bob, carol, own = emails
+        self.assertEqual(alice['id'], '<a1@example.com>')
+        self.assertEqual(alice['sender'], 'alice@example.com')
+        self.assertEqual(alice['recipient'], 'support@example.com')
+        self.assertEqual(alice['subject'], 'Pricing question')
+        self.assertEqual(alice['body'].strip(), 'Hello')
+        self.assertEqual(alice['thread_id'], '<a1@example.com>')
+        self.assertIsNone(alice['date'].tzinfo)
+
+        # The thread root is the first References entry
+        self.assertEqual(bob['thread_id'], '<a1@example.com>')
+
+        self.assertIsNone(carol['date'])
+        self.assertTrue(carol['id'].endswith('@bulk-process>'))
+        # Generated IDs are stable, so re-running over the archive doesn't duplicate it
+        self.assertEqual(carol['id'], list(iter_emails(self.mbox_path))[2]['id'])
+
+    def test_parse_eml_directory(self):
+        eml_dir = os.path.join(self.tmp.name, 'eml')
+        os.makedirs(eml_dir)
+        with open(os.path.join(eml_dir, 'one.eml'), 'wb') as f:
+            f.write(make_message('alice@example.com', 'From a file', message_id='<f1@example.com>').as_bytes())
+        with open(os.path.join(eml_dir, 'notes.txt'), 'w') as f:
+            f.write('not an email')
+        self.assertEqual([email['id'] for email in iter_emails(eml_dir)], ['<f1@example.com>'])
+
+    def test_since_skips_undated_messages(self):
+        emails = select_emails(iter_emails(self.mbox_path), since=datetime(2024, 10, 15))
+        self.assertEqual([email['id'] for email in emails], ['<b1@example.com>', '<s1@example.com>'])
+
+    def test_sender_and_subject_filters(self):
+        emails = list(select_emails(iter_emails(self.mbox_path), sender='ALICE'))
+        self.assertEqual([email['id'] for email in emails], ['<a1@example.com>'])
+        emails = list(select_emails(iter_emails(self.mbox_path), subject=r'^re:'))
+        self.assertEqual([email['id'] for email in emails], ['<b1@example.com>'])
+
+    def test_excludes_own_sender(self):
+        emails = list(select_emails(iter_emails(self.mbox_path), exclude_sender='SUPPORT@example.com'))
+        self.assertNotIn('<s1@example.com>', [email['id'] for email in emails])
+        self.assertEqual(len(emails), 3)
+
+    def test_limit_applies_after_checkpoint(self):
+        checkpoint = ProcessedEmails(os.path.join(self.tmp.name, 'checkpoint.json'))
+        checkpoint.processed_ids.add('<a1@example.com>')
+        processor = BulkProcessor(None, self.tmp.name, checkpoint)
+        emails = list(select_emails(processor.unprocessed(iter_emails(self.mbox_path)), limit=1))
+        self.assertEqual([email['id'] for email in emails], ['<b1@example.com>'])
+        self.assertEqual(processor.stats['skipped'], 1)
+
+    def test_fallback_ids_differ_by_body(self):
+        first = parse_message(make_message('carol@example.com', 'Refunds', body="First question about refunds"))
+        second = parse_message(make_message('carol@example.com', 'Refunds', body="Totally different second question"))
+        self.assertNotEqual(first['id'], second['id'])
+
+    def test_fallback_id_does_not_depend_on_local_timezone(self):
+        if not hasattr(time, 'tzset'):
+            self.skipTest("time.tzset is not available")
+        raw = make_message('carol@example.com', 'Refunds', date='Mon, 14 Oct 2024 10:00:00 +0000').as_bytes()
+        original_tz = os.environ.get('TZ')
+        ids = []
+        try:
+            for tz in ('UTC', 'America/New_York'):
+                os.environ['TZ'] = tz
+                time.tzset()
+                ids.append(parse_message(BytesParser(policy=policy.default).parsebytes(raw))['id'])
+        finally:
+            if original_tz is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = original_tz
+            time.tzset()
+        self.assertEqual(ids[0], ids[1])
+
+    def test_draft_path_keeps_similar_ids_apart(self):
+        prefix = '<' + 'a' * 200
+        self.assertNotEqual(draft_path('drafts', prefix + '1@example.com>'), draft_path('drafts', prefix + '2@example.com>'))
+        self.assertNotEqual(draft_path('drafts', '<a/b@example.com>'), draft_path('drafts', '<a_b@example.com>'))
+
+class FakePipeline:
+    """Returns a canned response per subject, or raises for subjects mapped to an exception."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def process_email(self, subject, body, sender, email_id=None):
+        self.calls.append(email_id)
+        response = self.responses[subject]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+class BulkProcessorRunTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.tmp.name, 'drafts')
+        self.checkpoint_path = os.path.join(self.tmp.name, 'checkpoint.json')
+        self.long_response = " ".join(["word"] * (MIN_RESPONSE_WORDS + 1))
+        self.emails = [
+            {'id': '<good@example.com>', 'sender': 'alice@example.com', 'subject': 'Good', 'body': 'Hello'},
+            {'id': '<short@example.com>', 'sender': 'bob@example.com', 'subject': 'Short', 'body': 'Hello'},
+            {'id': '<none@example.com>', 'sender': 'carol@example.com', 'subject': 'None', 'body': 'Hello'},
+            {'id': '<error@example.com>', 'sender': 'dave@example.com', 'subject': 'Error', 'body': 'Hello'},
+        ]
+        self.pipeline = FakePipeline({
+            'Good': self.long_response,
+            'Short': "Too short",
+            'None': None,
+            'Error': RuntimeError("LLM unavailable"),
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_processor(self):
+        checkpoint = ProcessedEmails(self.checkpoint_path)
+        processor = BulkProcessor(self.pipeline, self.output_dir, checkpoint, workers=2)
+        return processor, processor.run(processor.unprocessed(iter(self.emails)))
+
+    def test_run_writes_drafts_and_checkpoints_only_drafted(self):
+        _, stats = self.run_processor()
+        self.assertEqual(stats, {'drafted': 1, 'short': 1, 'failed': 2, 'skipped': 0})
+        self.assertCountEqual(self.pipeline.calls, [email['id'] for email in self.emails])
+
+        self.assertEqual(os.listdir(self.output_dir), [os.path.basename(draft_path(self.output_dir, '<good@example.com>'))])
+        with open(draft_path(self.output_dir, '<good@example.com>'), 'rb') as f:
+            draft = BytesParser(policy=policy.default).parse(f)
+        self.assertEqual(draft['To'], 'alice@example.com')
+        self.assertEqual(draft['Subject'], 'Re: Good')
+        self.assertEqual(draft['In-Reply-To'], '<good@example.com>')
+        self.assertEqual(draft['References'], '<good@example.com>')
+        self.assertEqual(draft.get_content().strip(), self.long_response)
+
+        with open(self.checkpoint_path) as f:
+            self.assertEqual(json.load(f), ['<good@example.com>'])
+
+    def test_second_run_skips_drafted_emails(self):
+        self.run_processor()
+        self.pipeline.calls = []
+        _, stats = self.run_processor()
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(stats['drafted'], 0)
+        self.assertCountEqual(self.pipeline.calls, ['<short@example.com>', '<none@example.com>', '<error@example.com>'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import signal
+import socket
+import tempfile
+import threading
+import unittest
+import tracemalloc
+import urllib.error
+import urllib.request
+from collections import Counter
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+from src import diagnostics
+from src.diagnostics import RuntimeDiagnostics, faiss_index_info, model_nbytes, process_memory
+
+class FakeTensor:
+    def __init__(self, element_size, nelement):
+        self._element_size = element_size
+        self._nelement = nelement
+
+    def element_size(self):
+        return self._element_size
+
+    def nelement(self):
+        return self._nelement
+
+class DiagnosticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.diagnostics = RuntimeDiagnostics(output_dir=self.tmp.name, port=0)
+
+    def tearDown(self):
+        self.diagnostics.stop_tracemalloc()
+        self.diagnostics.shutdown()
+        self.tmp.cleanup()
+
+class ProfileTest(DiagnosticsTestCase):
+    def test_stack_key_is_outermost_first(self):
+        def inner():
+            return sys._getframe()
+
+        def outer():
+            return inner()
+
+        key = RuntimeDiagnostics._stack_key(outer())
+        self.assertTrue(key[-1].startswith("inner (test_diagnostics.py:"))
+        self.assertTrue(key[-2].startswith("outer (test_diagnostics.py:"))
+
+    def test_profile_summary(self):
+        stacks = Counter({('run', 'fetch'): 3, ('run', 'parse'): 1})
+        summary = RuntimeDiagnostics._format_profile_summary(stacks, 4, 1.0, 0.01)
+        own, cumulative = summary.split("cumulative samples:")
+        self.assertIn("3   75.0%  fetch", own)
+        self.assertIn("1   25.0%  parse", own)
+        self.assertNotIn("run", own)
+        self.assertIn("4  100.0%  run", cumulative)
+
+    def test_capture_profile_writes_files(self):
+        path = self.diagnostics.capture_profile(seconds=0.05, interval=0.01)
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(os.path.exists(path[:-len('.txt')] + '.collapsed'))
+        self.assertIn("Sampling profile of the main thread", open(path).read())
+
+    def test_capture_profile_rejects_bad_arguments(self):
+        for seconds, interval in [(float('inf'), 0.01), (float('nan'), 0.01), (-1, 0.01), (1, 0)]:
+            self.assertIsNone(self.diagnostics.capture_profile(seconds=seconds, interval=interval))
+        self.assertFalse(self.diagnostics.profile_lock.locked())
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+class MemoryTest(DiagnosticsTestCase):
+    def test_reports_in_the_same_second_get_separate_files(self):
+        first = self.diagnostics.capture_memory_report()
+        second = self.diagnostics.capture_memory_report()
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 2)
+
+    def test_start_and_stop_tracemalloc(self):
+        self.assertTrue(self.diagnostics.start_tracemalloc(frames=1))
+        self.assertTrue(tracemalloc.is_tracing())
+        self.assertIsNotNone(self.diagnostics.last_snapshot)
+        self.assertFalse(self.diagnostics.start_tracemalloc(frames=1))
+
+        report = json.load(open(self.diagnostics.capture_memory_report()))
+        self.assertTrue(os.path.exists(report['tracemalloc']['diff_file']))
+
+        self.assertTrue(self.diagnostics.stop_tracemalloc())
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIsNone(self.diagnostics.last_snapshot)
+        self.assertFalse(self.diagnostics.stop_tracemalloc())
+
+    def test_signal_started_tracing_stops_after_timeout(self):
+        with mock.patch.object(diagnostics, 'DIAGNOSTICS_TRACEMALLOC_SECONDS', 0.5):
+            self.diagnostics.capture_memory_report(start_tracing=True)
+        timer = self.diagnostics.tracemalloc_timer
+        self.assertTrue(tracemalloc.is_tracing())
+        timer.join(5)
+        self.assertFalse(tracemalloc.is_tracing())
+        # The first report, then the final one with its tracemalloc diff
+        files = sorted(os.listdir(self.tmp.name))
+        self.assertEqual([name.split('_')[0] for name in files], ['memory', 'memory', 'tracemalloc'])
+
+    def test_process_memory_without_resource(self):
+        with mock.patch.object(diagnostics, 'resource', None):
+            self.assertNotIn('max_rss_bytes', process_memory())
+
+    def test_model_nbytes(self):
+        model = SimpleNamespace(
+            parameters=lambda: [FakeTensor(4, 10), FakeTensor(2, 5)],
+            buffers=lambda: [FakeTensor(8, 1)]
+        )
+        self.assertEqual(model_nbytes(model), 58)
+        self.assertIsNone(model_nbytes(None))
+        self.assertIsNone(model_nbytes(object()))
+
+    def test_faiss_index_info_does_not_serialize(self):
+        index = SimpleNamespace(ntotal=100, d=8, sa_code_size=lambda: 16)
+        self.assertEqual(faiss_index_info(SimpleNamespace(index=index))['bytes'], 1600)
+
+        flat_index = SimpleNamespace(ntotal=100, d=8)
+        self.assertEqual(faiss_index_info(SimpleNamespace(index=flat_index))['bytes'], 3200)
+        self.assertIsNone(faiss_index_info(SimpleNamespace()))
+
+class EndpointTest(DiagnosticsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.diagnostics._make_handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def get(self, path):
+        url = f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+        try:
+            with urllib.request.urlopen(url) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_profile_rejects_bad_seconds(self):
+        for seconds in ['inf', 'nan', '-1', '0', '100000', 'abc']:
+            status, _ = self.get(f'/profile?seconds={seconds}')
+            self.assertEqual(status, 400, seconds)
+        self.assertFalse(self.diagnostics.profile_lock.locked())
+
+    def test_profile_conflict_while_running(self):
+        with self.diagnostics.profile_lock:
+            status, _ = self.get('/profile?seconds=1')
+        self.assertEqual(status, 409)
+
+    def test_tracemalloc_start_rejects_bad_frames(self):
+        self.assertEqual(self.get('/tracemalloc/start?frames=0')[0], 400)
+        self.assertEqual(self.get('/tracemalloc/start?frames=x')[0], 400)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_tracemalloc_start_and_stop(self):
+        self.assertEqual(self.get('/tracemalloc/start?frames=1'), (200, {'status': 'started'}))
+        self.assertEqual(self.get('/tracemalloc/stop'), (200, {'status': 'stopped'}))
+
+    def test_unknown_path(self):
+        self.assertEqual(self.get('/nope')[0], 404)
+
+class InstallTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.handlers = {}
+        if hasattr(signal, 'SIGUSR1'):
+            self.handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGUSR1, signal.SIGUSR2)}
+
+    def tearDown(self):
+        for sig, handler in self.handlers.items():
+            signal.signal(sig, handler)
+        self.tmp.cleanup()
+
+    def test_busy_port_does_not_raise(self):
+        busy = socket.socket()
+        busy.bind(('127.0.0.1', 0))
+        busy.listen()
+        try:
+            runtime = RuntimeDiagnostics(output_dir=self.tmp.name, port=busy.getsockname()[1])
+            with self.assertLogs(level='ERROR'):
+                runtime.install()
+            self.assertIsNone(runtime.server)
+        finally:
+            busy.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from types import SimpleNamespace
+from src.email_history import EmailHistory
+
+class FakeVectorStore:
+    """Stands in for the FAISS store so tests don't need OpenAI embeddings."""
+
+    def __init__(self, fail_on_call=None, on_add=None):
+        self.texts = []
+        self.metadatas = []
+        self.add_calls = 0
+        self.saves = 0
+        self.saved_count = 0
+        self.fail_on_call = fail_on_call
+        self.on_add = on_add
+
+    def add_texts(self, texts, metadatas):
+        self.add_calls += 1
+        if self.on_add:
+            self.on_add()
+        if self.add_calls == self.fail_on_call:
+            raise RuntimeError("embedding request failed")
+        start = len(self.texts)
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        return [str(i) for i in range(start, len(self.texts))]
+
+    def similarity_search_with_score(self, query, k):
+        docs = [SimpleNamespace(metadata=metadata) for metadata in self.metadatas]
+        return [(doc, 0.1 * i) for i, doc in enumerate(docs[:k])]
+
+def make_email(i, body=None):
+    return {
+        'id': f'<{i}@example.com>', 'sender': 'alice@example.com', 'recipient': 'me',
+        'subject': f'Subject {i}', 'body': body or f'Body {i}', 'date': None, 'thread_id': f'<{i}@example.com>',
+    }
+
+class EmailHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.history = self.make_history(FakeVectorStore())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_history(self, vector_store):
+        history = EmailHistory.__new__(EmailHistory)
+        history.db_path = os.path.join(self.tmp.name, 'email_history.db')
+        history.setup_database()
+        history.vector_store = vector_store
+
+        def save_vector_store():
+            vector_store.saves += 1
+            vector_store.saved_count = len(vector_store.texts)
+        history.save_vector_store = save_vector_store
+        return history
+
+    def stored_ids(self):
+        conn = sqlite3.connect(self.history.db_path)
+        ids = [row[0] for row in conn.execute("SELECT id FROM emails ORDER BY id")]
+        conn.close()
+        return ids
+
+    def test_add_emails_batches_embedding_calls(self):
+        added = self.history.add_emails((make_email(i) for i in range(25)), batch_size=10)
+        self.assertEqual(added, 25)
+        self.assertEqual(self.history.vector_store.add_calls, 3)
+        self.assertEqual(len(self.stored_ids()), 25)
+
+    def test_add_emails_skips_duplicates_within_and_across_batches(self):
+        emails = [make_email(1), make_email(2), make_email(1), make_email(3), make_email(2)]
+        self.assertEqual(self.history.add_emails(emails, batch_size=3), 3)
+        self.assertEqual(len(self.history.vector_store.texts), 3)
+        self.assertEqual(self.stored_ids(), ['<1@example.com>', '<2@example.com>', '<3@example.com>'])
+
+        # Loading the same archive again adds nothing
+        self.assertEqual(self.history.add_emails(emails, batch_size=3), 0)
+        self.assertEqual(len(self.history.vector_store.texts), 3)
+
+    def test_add_emails_saves_vectors_with_each_commit(self):
+        self.history.add_emails((make_email(i) for i in range(50)), batch_size=10, save_every=2)
+        # Saved after batches 2 and 4, then once more at the end
+        self.assertEqual(self.history.vector_store.saves, 3)
+        self.assertEqual(self.history.vector_store.saved_count, 50)
+
+    def test_failed_load_keeps_only_rows_with_saved_vectors(self):
+        vector_store = FakeVectorStore(fail_on_call=4)
+        self.history = self.make_history(vector_store)
+        with self.assertRaises(RuntimeError):
+            self.history.add_emails((make_email(i) for i in range(50)), batch_size=10, save_every=2)
+        self.assertEqual(vector_store.saved_count, 20)
+        self.assertEqual(len(self.stored_ids()), 20)
+
+    def test_save_interval_grows_with_the_index(self):
+        self.history.add_emails((make_email(i) for i in range(200)), batch_size=10, save_every=1)
+        # Saved at 10, 20, 40, 80 and 160 emails, then at the end, instead of after all 20 batches
+        self.assertEqual(self.history.vector_store.saves, 6)
+        self.assertEqual(len(self.stored_ids()), 200)
+
+    def test_database_is_not_locked_during_embedding(self):
+        def write_from_another_connection():
+            conn = sqlite3.connect(self.history.db_path, timeout=0)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.rollback()
+            finally:
+                conn.close()
+
+        self.history = self.make_history(FakeVectorStore(on_add=write_from_another_connection))
+        self.history.add_emails((make_email(i) for i in range(30)), batch_size=10, save_every=1)
+        self.assertEqual(len(self.stored_ids()), 30)
+
+    def test_search_similar_emails_drops_duplicate_vectors(self):
+        self.history.add_emails([make_email(i) for i in range(4)])
+        # A load interrupted between saving vectors and writing rows re-adds the same email
+        vector_store = self.history.vector_store
+        vector_store.metadatas[1:1] = [{"email_id": '<0@example.com>'}]
+        vector_store.metadatas[0:0] = [{"email_id": '<0@example.com>'}]
+
+        results = self.history.search_similar_emails("query", k=3)
+        self.assertEqual([email['id'] for email in results],
+                         ['<0@example.com>', '<1@example.com>', '<2@example.com>'])
+
+        results = self.history.search_similar_emails("query", k=3, exclude_id='<0@example.com>')
+        self.assertEqual([email['id'] for email in results],
+                         ['<1@example.com>', '<2@example.com>', '<3@example.com>'])
+
+    def test_search_similar_emails_excludes_id(self):
+        self.history.add_emails([make_email(i) for i in range(5)])
+        results = self.history.search_similar_emails("query", k=3, exclude_id='<0@example.com>')
+        self.assertEqual([email['id'] for email in results],
+                         ['<1@example.com>', '<2@example.com>', '<3@example.com>'])
+
+        results = self.history.search_similar_emails("query", k=3)
+        self.assertEqual([email['id'] for email in results],
+                         ['<0@example.com>', '<1@example.com>', '<2@example.com>'])
+
+if __name__ == '__main__':
+    unittest.main()
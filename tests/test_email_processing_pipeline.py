@@ -0,0 +1,150 @@
+import unittest
+from types import SimpleNamespace
+from config import MIN_RESPONSE_WORDS
+from src.email_processing_pipeline import (
+    REQUIRED_SECTIONS, KeywordQueryBuilder, ProcessingPipeline, check_response,
+    format_kb_context, format_email_history_context
+)
+
+def make_response(words, sections=REQUIRED_SECTIONS):
+    """A response with every given heading, padded to exactly `words` words."""
+    heading_words = sum(len(section.split()) for section in sections)
+    padding = " ".join(["word"] * (words - heading_words))
+    return "\n".join(sections) + "\n" + padding
+
+class CheckResponseTest(unittest.TestCase):
+    def test_complete_response_passes(self):
+        self.assertEqual(check_response(make_response(MIN_RESPONSE_WORDS + 1)), [])
+
+    def test_empty_response(self):
+        self.assertEqual(check_response(""), ["empty response"])
+        self.assertEqual(check_response(None), ["empty response"])
+
+    def test_missing_section(self):
+        response = make_response(MIN_RESPONSE_WORDS + 10, sections=REQUIRED_SECTIONS[:-1])
+        self.assertEqual(check_response(response), ["missing section '# Draft Response'"])
+
+    def test_second_level_heading_does_not_count(self):
+        sections = ["#" + section for section in REQUIRED_SECTIONS]
+        problems = check_response(make_response(MIN_RESPONSE_WORDS + 10, sections=sections))
+        self.assertEqual(problems, [f"missing section '{section}'" for section in REQUIRED_SECTIONS])
+
+    def test_heading_with_suffix_counts(self):
+        sections = [section + " (with citations)" for section in REQUIRED_SECTIONS]
+        self.assertEqual(check_response(make_response(MIN_RESPONSE_WORDS + 10, sections=sections)), [])
+
+    def test_word_count_boundary(self):
+        # main.py only drafts responses with more than MIN_RESPONSE_WORDS words
+        self.assertEqual(check_response(make_response(MIN_RESPONSE_WORDS)),
+                         [f"only {MIN_RESPONSE_WORDS} words"])
+        self.assertEqual(check_response(make_response(MIN_RESPONSE_WORDS + 1)), [])
+
+class KeywordQueryBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.builder = KeywordQueryBuilder(max_keywords=3)
+
+    def test_drops_stop_words_and_greetings(self):
+        keywords = KeywordQueryBuilder().extract_keywords("Hi, what is the refund policy? Thanks")
+        self.assertEqual(keywords, ["refund", "policy"])
+
+    def test_subject_terms_outrank_frequent_body_terms(self):
+        query = self.builder.build_query(
+            "Invoice question",
+            "The shipping shipping shipping was late and the warehouse sent tracking details."
+        )
+        self.assertEqual(query, "invoice question shipping")
+
+    def test_keywords_keep_first_seen_order(self):
+        query = KeywordQueryBuilder().build_query("Enterprise pricing", "Is onboarding included in enterprise pricing?")
+        self.assertEqual(query, "enterprise pricing onboarding included")
+
+    def test_falls_back_to_subject(self):
+        self.assertEqual(self.builder.build_query("Hi", "Thanks!"), "Hi")
+
+class FormatContextTest(unittest.TestCase):
+    def make_doc(self, content, page=None):
+        metadata = {'source': 'kb.pdf'}
+        if page is not None:
+            metadata['page'] = page
+        return SimpleNamespace(page_content=content, metadata=metadata)
+
+    def test_kb_context_cites_source_and_page(self):
+        context = format_kb_context([self.make_doc("Refunds take 5 days.", page=0)], 1000)
+        self.assertEqual(context, "[1] (kb.pdf, page 1)\nRefunds take 5 days.")
+
+    def test_kb_context_truncates_to_budget(self):
+        docs = [self.make_doc("alpha " * 20), self.make_doc("beta " * 20), self.make_doc("gamma " * 20)]
+        context = format_kb_context(docs, 150)
+        self.assertIn("[1] (kb.pdf)", context)
+        self.assertIn("[2] (kb.pdf)", context)
+        self.assertNotIn("gamma", context)
+        self.assertTrue(context.endswith(" ..."))
+        # The budget is shared across excerpts, so the second one is cut short
+        contents = [part.split("\n", 1)[1] for part in context.split("\n\n")]
+        self.assertLessEqual(sum(len(content) for content in contents), 150 + len(" ..."))
+
+    def test_kb_context_without_documents(self):
+        self.assertEqual(format_kb_context([], 1000), "No relevant knowledge base content found.")
+
+    def test_history_context_splits_budget_between_emails(self):
+        emails = [{'sender': f'user{i}@example.com', 'subject': 'Order', 'date': '2024-10-01', 'body': "x " * 500}
+                  for i in range(4)]
+        context = format_email_history_context(emails, 300)
+        # Only the top three emails are used, each getting a third of the budget
+        self.assertEqual(context.count("**Sender:**"), 3)
+        self.assertNotIn("user3@example.com", context)
+        for entry in context.split("**Date:**")[1:]:
+            body = entry.split("**Subject:** Order\n", 1)[1]
+            self.assertLessEqual(len(body.strip()), 100 + len(" ..."))
+
+    def test_history_context_without_emails(self):
+        self.assertEqual(format_email_history_context([], 1000), "No relevant email history found.")
+
+class FakeReviewer:
+    def __init__(self):
+        self.calls = []
+
+    def review_fast_response(self, *args):
+        self.calls.append(args)
+        return make_response(MIN_RESPONSE_WORDS + 5)
+
+class FastPathTest(unittest.TestCase):
+    def make_pipeline(self, generated):
+        pipeline = ProcessingPipeline.__new__(ProcessingPipeline)
+        pipeline.mode = 'fast'
+        pipeline.query_builder = KeywordQueryBuilder()
+        pipeline.kb_searcher = SimpleNamespace(search=lambda query: [
+            SimpleNamespace(page_content="Refunds take 5 days.", metadata={'source': 'kb.pdf'})
+        ])
+        pipeline.email_history = SimpleNamespace(search_similar_emails=lambda query, exclude_id=None: [])
+        pipeline.response_generator = SimpleNamespace(
+            generate_response_from_context=lambda *args: generated
+        )
+        pipeline.final_reviewer = FakeReviewer()
+        return pipeline
+
+    def test_passing_response_skips_review(self):
+        response = make_response(MIN_RESPONSE_WORDS + 5)
+        pipeline = self.make_pipeline(response)
+        self.assertEqual(pipeline.process_email("Refund", "How long do refunds take?", "a@example.com"), response)
+        self.assertEqual(pipeline.final_reviewer.calls, [])
+
+    def test_empty_response_is_not_reviewed(self):
+        pipeline = self.make_pipeline("")
+        self.assertIsNone(pipeline.process_email("Refund", "How long do refunds take?", "a@example.com"))
+        self.assertEqual(pipeline.final_reviewer.calls, [])
+
+    def test_failed_checks_send_email_and_context_to_reviewer(self):
+        pipeline = self.make_pipeline("# Context Summary\nToo short")
+        response = pipeline.process_email("Refund", "How long do refunds take?", "a@example.com")
+        self.assertEqual(response, make_response(MIN_RESPONSE_WORDS + 5))
+
+        subject, body, initial, kb_context, history_context, problems = pipeline.final_reviewer.calls[0]
+        self.assertEqual((subject, body), ("Refund", "How long do refunds take?"))
+        self.assertEqual(initial, "# Context Summary\nToo short")
+        self.assertIn("Refunds take 5 days.", kb_context)
+        self.assertEqual(history_context, "No relevant email history found.")
+        self.assertIn("missing section '# Draft Response'", problems)
+
+if __name__ == '__main__':
+    unittest.main()